@@ -20,11 +20,28 @@ References:
     https://static.anaf.ro/static/IFN/instructiuni_ifn.html
 """
 
+import asyncio
 import logging
-import requests
-from fastapi import FastAPI, HTTPException, Response
-from pydantic import BaseModel
-from typing import Optional
+import os
+import re
+import ssl
+import time
+from contextlib import asynccontextmanager
+
+import certifi
+import httpx
+import orjson
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, StringConstraints, field_validator
+from typing import (
+    Annotated,
+    AsyncIterator,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Union,
+)
 import base64
 
 # Configuration
@@ -41,65 +58,236 @@ API_BASE_URL = "https://financiart.anaf.ro/BANCIWS/rest/"
 # in case of the system not trusing the Digicert CA you can add the CA chain here
 VERIFY_CA = True
 
+# Minimum TLS version accepted from the upstream. This is a strictness switch,
+# not a speedup: TLS 1.3 is negotiated anyway whenever F5 offers it, this only
+# refuses to fall back. Set it to ssl.TLSVersion.TLSv1_2 if the handshake fails
+# (e.g. F5 only offers TLS 1.2 or its client certificate request needs it).
+TLS_MIN_VERSION = ssl.TLSVersion.TLSv1_3
+
+# At most MAX_CONCURRENT_UPSTREAM calls are in flight towards ANAF at once,
+# the rest wait up to QUEUE_TIMEOUT seconds for a slot before getting a 503.
+# This protects the F5 APM session budget and smooths bursts.
+MAX_CONCURRENT_UPSTREAM = 16
+QUEUE_TIMEOUT = 10.0
+
+# Connection pool geometry for the upstream client. Concurrency is bounded by
+# the semaphore above (auth calls included), so the pool is sized to match it:
+# every in-flight call gets a connection and all of them stay warm between
+# bursts instead of being closed and re-handshaked.
+POOL_MAX_KEEPALIVE = MAX_CONCURRENT_UPSTREAM
+POOL_MAX_CONNECTIONS = MAX_CONCURRENT_UPSTREAM
+POOL_KEEPALIVE_EXPIRY = 30.0
+
+# F5 APM drops idle sessions silently. After this many seconds without a
+# successful call the session is refreshed before sending, instead of wasting
+# a round trip on a request that would come back as the login page.
+# Tune it to stay below the APM inactivity timeout.
+AUTH_TTL = 270.0
+
+# Streamed request bodies (uploads) are sent in slices of this size.
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
 HEADERS = {
     "Content-Type": "application/xml",
     "User-Agent": "anaf-api-integration/v1.0",
+    # httpx decompresses transparently, response.content is the plain XML
+    "Accept-Encoding": "gzip, deflate",
 }
 
+# XML payload templates, split around the single user supplied attribute.
+# They are kept as bytes so building a request body is a plain concatenation.
+_LISTA_PREFIX = (
+    b'<?xml version="1.0" encoding="UTF-8"?>\n'
+    b'<header xmlns="mfp:anaf:dgti:banci:reqListaMesaje:v1"\n'
+    b'        xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n'
+    b'    <listaMesaje Zile="'
+)
+_LISTA_SUFFIX = b'"/>\n</header>'
+
+_STARE_PREFIX = (
+    b'<?xml version="1.0" encoding="UTF-8"?>\n'
+    b'<header xmlns="mfp:anaf:dgti:banci:reqStareMesaj:v1"\n'
+    b'        xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n'
+    b'    <listaMesaje index_incarcare="'
+)
+_STARE_SUFFIX = b'"/>\n</header>'
+
+_DESCARCARE_PREFIX = (
+    b'<?xml version="1.0" encoding="UTF-8"?>\n'
+    b'<header xmlns="mfp:anaf:dgti:banci:reqDescarcareMesaj:v1"\n'
+    b'        xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"\n'
+    b'        id_portal="'
+)
+_DESCARCARE_SUFFIX = b'">\n</header>'
+
+_UPLOAD_PREFIX = (
+    b'<?xml version="1.0" encoding="UTF-8"?>\n'
+    b'<header xmlns="mfp:anaf:dgti:banci:reqUploadFisier:v1"\n'
+    b'        xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n'
+    b'    <upload fisier="'
+)
+_UPLOAD_SUFFIX = b'"/>\n</header>'
+
+# Body of the dummy request used to trigger the F5 session, built once.
+_AUTH_PAYLOAD = _LISTA_PREFIX + b"1/24" + _LISTA_SUFFIX
+
+# Markers of the F5 login/policy page, matched in one pass over the start of
+# the response body.
+_LOGIN_MARKERS = re.compile(rb"<html|<!doctype html|/my\.policy", re.IGNORECASE)
+_LOGIN_SCAN_BYTES = 512
+
+# Request fields are validated against these so they never contain characters
+# that need XML escaping and can be copied into the templates as-is.
+XmlToken = Annotated[
+    str, StringConstraints(pattern=r"^[A-Za-z0-9_\-./]+$", max_length=64)
+]
+
+# Translation table deleting every base64 data character; what survives a
+# translate() is padding or garbage.
+_B64_DELETE = str.maketrans(
+    "", "", "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+)
+
 
 class ListaMesajeRequest(BaseModel):
-    zile: str = "1/24"
+    zile: XmlToken = "1/24"
 
 
 class StareMesajRequest(BaseModel):
-    index_incarcare: str
+    index_incarcare: XmlToken
 
 
 class DescarcareMesajRequest(BaseModel):
-    id_portal: str
+    id_portal: XmlToken
 
 
 class UploadMesajRequest(BaseModel):
     fisier_b64: str
 
+    @field_validator("fisier_b64")
+    @classmethod
+    def check_base64(cls, value: str) -> str:
+        # One C-level pass over the str, without copying the upload. A valid
+        # payload leaves nothing behind except its trailing "=" padding.
+        leftover = value.translate(_B64_DELETE)
+        if (
+            not value
+            or len(value) % 4
+            or leftover not in ("", "=", "==")
+            or not value.endswith(leftover)
+        ):
+            raise ValueError("fisier_b64 must be a base64 encoded file")
+        return value
+
+
+def build_ssl_context() -> ssl.SSLContext:
+    """Load the CA bundle and the ANAF client certificate once.
+
+    The same context is handed to every pooled connection, so the certificate
+    and key are parsed a single time instead of per connection.
+    """
+    # VERIFY_CA keeps the requests semantics: True for the certifi CA bundle,
+    # a path to a CA bundle file or directory, or False to skip verification.
+    if VERIFY_CA is False:
+        ctx = ssl.create_default_context()
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+    elif isinstance(VERIFY_CA, str) and os.path.isdir(VERIFY_CA):
+        ctx = ssl.create_default_context(capath=VERIFY_CA)
+    elif isinstance(VERIFY_CA, str):
+        ctx = ssl.create_default_context(cafile=VERIFY_CA)
+    else:
+        ctx = ssl.create_default_context(cafile=certifi.where())
+    ctx.minimum_version = TLS_MIN_VERSION
+    ctx.load_cert_chain(CERT_PATH, KEY_PATH)
+    return ctx
+
+
+async def iter_chunks(parts: Sequence[bytes]) -> AsyncIterator[memoryview]:
+    for part in parts:
+        view = memoryview(part)
+        for start in range(0, len(view), UPLOAD_CHUNK_SIZE):
+            yield view[start : start + UPLOAD_CHUNK_SIZE]
+
 
 # --- ANAF Gateway Logic ---
 class ANAFGateway:
     def __init__(self):
-        self.session = requests.Session()
-        self.session.cert = (CERT_PATH, KEY_PATH)
-        self.session.verify = VERIFY_CA
-        self.session.headers.update(HEADERS)
+        self.client: Optional[httpx.AsyncClient] = None
+        self.ssl_context = build_ssl_context()
         self._authenticated = False
+        # Serializes F5 session establishment; the epoch is bumped after every
+        # successful auth so waiters can tell someone already re-authenticated.
+        self._auth_lock = asyncio.Lock()
+        self._auth_epoch = 0
+        self._last_activity = 0.0
+        self._sem = asyncio.Semaphore(MAX_CONCURRENT_UPSTREAM)
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+
+    async def startup(self):
+        # The client (and its cookie jar / connection pool) lives for the whole
+        # app lifetime so the F5 session cookies are shared by every request.
+        self.client = httpx.AsyncClient(
+            verify=self.ssl_context,
+            headers=HEADERS,
+            timeout=httpx.Timeout(60.0),
+            http2=True,
+            limits=httpx.Limits(
+                max_keepalive_connections=POOL_MAX_KEEPALIVE,
+                max_connections=POOL_MAX_CONNECTIONS,
+                keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+            ),
+        )
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+        self._authenticated = False
+
+    @staticmethod
+    def _looks_like_login(response: httpx.Response) -> bool:
+        # F5 answers with its HTML login/policy page instead of API XML.
+        # The header decides when it can, the body is only peeked at otherwise.
+        content_type = response.headers.get("content-type", "").lower()
+        if "xml" in content_type:
+            return False
+        if "text/html" in content_type:
+            return True
+        return (
+            _LOGIN_MARKERS.search(response.content, 0, _LOGIN_SCAN_BYTES)
+            is not None
+        )
+
+    @classmethod
+    def _session_expired(cls, response: httpx.Response) -> bool:
+        return (
+            response.status_code in [401, 403, 405, 302, 301]
+            or cls._looks_like_login(response)
+        )
 
     # IMPORTANT:
     # This request is intentionally used only to trigger the F5 Big-IP
     # authentication flow and establish a session (cookies).
     # The response payload itself is irrelevant.
-    def _authenticate(self):
+    async def _authenticate(self):
         logger.info("Gateway: establishing fresh F5 session...")
         url = API_BASE_URL + "listaMesaje"
 
-        payload = """<?xml version="1.0" encoding="UTF-8"?>
-        <header xmlns="mfp:anaf:dgti:banci:reqListaMesaje:v1" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
-            <listaMesaje Zile="1/24"/>
-        </header>"""
-
         try:
-            # allow_redirects=True is key for F5 to set cookies during redirects
-            response = self.session.post(
-                url, data=payload, timeout=30, allow_redirects=True
+            # follow_redirects=True is key for F5 to set cookies during redirects
+            response = await self.client.post(
+                url, content=_AUTH_PAYLOAD, timeout=30, follow_redirects=True
             )
 
             if response.status_code not in [200, 405]:
-                logger.error(f"Auth failed with status {response.status_code}")
+                logger.error("Auth failed with status %s", response.status_code)
                 raise HTTPException(status_code=502, detail="Upstream ANAF Auth Failed")
 
             # Check if we got the HTML login page instead of XML (mtls failed with f5)
-            if (
-                "text/html" in response.headers.get("Content-Type", "")
-                or "<html" in response.text[:100].lower()
-            ):
+            if self._looks_like_login(response):
                 logger.error(
                     "Auth failed: Received HTML login page instead of API response."
                 )
@@ -109,52 +297,141 @@ class ANAFGateway:
 
             logger.info("Gateway: F5 Session established successfully.")
             self._authenticated = True
+            self._last_activity = time.monotonic()
 
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Network error during auth: {e}")
+        except httpx.HTTPError as e:
+            logger.error("Network error during auth: %s", e)
             raise HTTPException(status_code=503, detail="ANAF Connection Error")
 
-    def post_xml(self, endpoint: str, payload: str):
+    async def _reauthenticate(self, epoch: int):
+        # Only the first coroutine that saw `epoch` does the handshake, the
+        # others wait on the lock and reuse the freshly issued cookies.
+        async with self._auth_lock:
+            if epoch == self._auth_epoch:
+                await self._authenticate()
+                self._auth_epoch += 1
+
+    async def _send(self, url: str, payload: Union[bytes, Sequence[bytes]]):
+        # IMPORTANT: when doing requests to the API disable redirects so if the session
+        # timed out it would not go to the auth procces from here.
+        if isinstance(payload, bytes):
+            return await self.client.post(
+                url, content=payload, timeout=60, follow_redirects=False
+            )
+
+        # Multi-part payloads are streamed so the full XML document is never
+        # assembled in memory. A fresh iterator is built on every call so the
+        # body can be replayed after a re-auth, and Content-Length is set
+        # explicitly to avoid chunked transfer encoding towards F5.
+        length = sum(len(part) for part in payload)
+        return await self.client.post(
+            url,
+            content=iter_chunks(payload),
+            headers={"Content-Length": str(length)},
+            timeout=60,
+            follow_redirects=False,
+        )
+
+    def stats(self) -> dict:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "rejected": self.rejected,
+        }
+
+    async def post_xml(self, endpoint: str, payload: Union[bytes, Sequence[bytes]]):
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._sem.acquire(), timeout=QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            logger.warning("Upstream queue full, rejecting request to %s", endpoint)
+            raise HTTPException(status_code=503, detail="Gateway overloaded")
+        finally:
+            self.queued -= 1
+
+        self.active += 1
+        try:
+            return await self._post_xml(endpoint, payload)
+        finally:
+            self.active -= 1
+            self._sem.release()
+
+    async def _post_xml(self, endpoint: str, payload: Union[bytes, Sequence[bytes]]):
         url = API_BASE_URL + endpoint
 
-        if not self._authenticated:
-            self._authenticate()
+        idle = time.monotonic() - self._last_activity
+        if not self._authenticated or idle > AUTH_TTL:
+            await self._reauthenticate(self._auth_epoch)
 
-        logger.debug(f"Sending request to {endpoint}")
+        logger.debug("Sending request to %s", endpoint)
 
         try:
-            # IMPORTANT: when doing requests to the API disable redirects so if the session
-            # timed out it would not go to the auth procces from here.
-            response = self.session.post(
-                url, data=payload, timeout=60, allow_redirects=False
-            )
+            # Remember which session this request was sent with, so an expiry
+            # already handled by another request does not trigger a second auth.
+            epoch = self._auth_epoch
+
+            response = await self._send(url, payload)
 
             # If F5 returns HTML, redirects, or auth-related status codes,
             # assume the session expired and re-authenticate once.
-            session_expired = (
-                response.status_code in [401, 403, 405, 302, 301]
-                or "text/html" in response.headers.get("Content-Type", "")
-                or "<html" in response.text[:100].lower()
-            )
-
-            if session_expired:
+            if self._session_expired(response):
                 logger.warning(
                     "F5 Session likely expired. Re-authenticating and retrying..."
                 )
-                self._authenticate()
-                response = self.session.post(
-                    url, data=payload, timeout=60, allow_redirects=False
-                )
+                await self._reauthenticate(epoch)
+                response = await self._send(url, payload)
 
+            # only a response that made it past F5 proves the session is alive
+            if not self._session_expired(response):
+                self._last_activity = time.monotonic()
             return response
 
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Request failed: {e}")
+        except httpx.HTTPError as e:
+            logger.error("Request failed: %s", e)
             raise HTTPException(status_code=502, detail=f"Upstream Error: {str(e)}")
 
 
-gateway = ANAFGateway()
-app = FastAPI(title="ANAF IFN Gateway")
+# The gateway is created per worker process at startup (after uvicorn forks),
+# so importing this module does not load certificates or open connections.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.gateway = ANAFGateway()
+    await app.state.gateway.startup()
+    try:
+        yield
+    finally:
+        await app.state.gateway.aclose()
+
+
+class OrjsonRequest(Request):
+    async def json(self):
+        if not hasattr(self, "_json"):
+            # orjson.JSONDecodeError subclasses json.JSONDecodeError, so FastAPI
+            # still turns malformed bodies into a 422
+            self._json = orjson.loads(await self.body())
+        return self._json
+
+
+class OrjsonRoute(APIRoute):
+    """Route that parses JSON request bodies with orjson instead of stdlib json."""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def route_handler(request: Request) -> Response:
+            return await handler(OrjsonRequest(request.scope, request.receive))
+
+        return route_handler
+
+
+app = FastAPI(title="ANAF IFN Gateway", lifespan=lifespan)
+# must be set before any route is registered
+app.router.route_class = OrjsonRoute
+
+
+def get_gateway(request: Request) -> ANAFGateway:
+    return request.app.state.gateway
 
 
 # Endpoints
@@ -163,88 +440,105 @@ app = FastAPI(title="ANAF IFN Gateway")
     response_class=Response,
     responses={200: {"content": {"application/xml": {}}}},
 )
-def health_check():
+async def health_check():
     return Response(media_type="application/xml", status_code=200)
 
 
-@app.post(
-    "/lista-mesaje",
-    response_class=Response,
-    responses={200: {"content": {"application/xml": {}}}},
-)
-def get_lista_mesaje(req: ListaMesajeRequest):
-    payload = f"""<?xml version="1.0" encoding="UTF-8"?>
-        <header xmlns="mfp:anaf:dgti:banci:reqListaMesaje:v1"
-                xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
-            <listaMesaje Zile="{req.zile}"/>
-        </header>"""
-
-    response = gateway.post_xml("listaMesaje", payload)
-    return Response(
-        content=response.text,
-        media_type="application/xml",
-        status_code=response.status_code,
-    )
-
-
-@app.post(
-    "/stare-mesaj",
-    response_class=Response,
-    responses={200: {"content": {"application/xml": {}}}},
-)
-def get_stare_mesaj(req: StareMesajRequest):
-    payload = f"""<?xml version="1.0" encoding="UTF-8"?>
-        <header xmlns="mfp:anaf:dgti:banci:reqStareMesaj:v1"
-                xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
-            <listaMesaje index_incarcare="{req.index_incarcare}"/>
-        </header>"""
-
-    response = gateway.post_xml("stareMesaj", payload)
-    return Response(
-        content=response.text,
-        media_type="application/xml",
-        status_code=response.status_code,
-    )
-
-
-@app.post(
-    "/descarcare-mesaj",
-    response_class=Response,
-    responses={200: {"content": {"application/xml": {}}}},
-)
-def download_mesaj(req: DescarcareMesajRequest):
-    payload = f"""<?xml version="1.0" encoding="UTF-8"?>
-        <header xmlns="mfp:anaf:dgti:banci:reqDescarcareMesaj:v1"
-                xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-                id_portal="{req.id_portal}">
-        </header>"""
-
-    response = gateway.post_xml("descarcare", payload)
-    return Response(
-        content=response.text,
-        media_type="application/xml",
-        status_code=response.status_code,
-    )
-
-
-@app.post(
-    "/upload-mesaj",
-    response_class=Response,
-    responses={200: {"content": {"application/xml": {}}}},
-)
-def upload_mesaj(req: UploadMesajRequest):
-    payload = f"""<?xml version="1.0" encoding="UTF-8"?>
-        <header xmlns="mfp:anaf:dgti:banci:reqUploadFisier:v1"
-                xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
-            <upload fisier="{req.fisier_b64}"/>
-        </header>"""
-
-    response = gateway.post_xml("uploadMesaj", payload)
-    return Response(
-        content=response.text,
-        media_type="application/xml",
-        status_code=response.status_code,
-    )
+@app.get("/stats")
+async def upstream_stats(gateway: ANAFGateway = Depends(get_gateway)):
+    return gateway.stats()
+
+
+# XML proxy endpoints. Each route maps a gateway path onto an ANAF service.
+class XmlRoute(NamedTuple):
+    path: str
+    name: str
+    model: type
+    field: str
+    prefix: bytes
+    suffix: bytes
+    endpoint: str
+    stream: bool
+
+
+_ROUTES = [
+    XmlRoute(
+        path="/lista-mesaje",
+        name="get_lista_mesaje",
+        model=ListaMesajeRequest,
+        field="zile",
+        prefix=_LISTA_PREFIX,
+        suffix=_LISTA_SUFFIX,
+        endpoint="listaMesaje",
+        stream=False,
+    ),
+    XmlRoute(
+        path="/stare-mesaj",
+        name="get_stare_mesaj",
+        model=StareMesajRequest,
+        field="index_incarcare",
+        prefix=_STARE_PREFIX,
+        suffix=_STARE_SUFFIX,
+        endpoint="stareMesaj",
+        stream=False,
+    ),
+    XmlRoute(
+        path="/descarcare-mesaj",
+        name="download_mesaj",
+        model=DescarcareMesajRequest,
+        field="id_portal",
+        prefix=_DESCARCARE_PREFIX,
+        suffix=_DESCARCARE_SUFFIX,
+        endpoint="descarcare",
+        stream=False,
+    ),
+    # the base64 file can be large, send it as parts instead of one document
+    XmlRoute(
+        path="/upload-mesaj",
+        name="upload_mesaj",
+        model=UploadMesajRequest,
+        field="fisier_b64",
+        prefix=_UPLOAD_PREFIX,
+        suffix=_UPLOAD_SUFFIX,
+        endpoint="uploadMesaj",
+        stream=True,
+    ),
+]
+
+
+def make_xml_handler(route: XmlRoute):
+    async def handler(
+        req: route.model, gateway: ANAFGateway = Depends(get_gateway)
+    ):
+        value = getattr(req, route.field).encode("ascii")
+        if route.stream:
+            payload = (route.prefix, value, route.suffix)
+        else:
+            payload = route.prefix + value + route.suffix
+
+        response = await gateway.post_xml(route.endpoint, payload)
+        return Response(
+            content=response.content,
+            media_type="application/xml",
+            status_code=response.status_code,
+        )
+
+    return handler
+
+
+def register_xml_routes(app: FastAPI):
+    for route in _ROUTES:
+        app.add_api_route(
+            route.path,
+            make_xml_handler(route),
+            methods=["POST"],
+            name=route.name,
+            response_class=Response,
+            responses={200: {"content": {"application/xml": {}}}},
+        )
+
+
+register_xml_routes(app)
 
 
 if __name__ == "__main__":